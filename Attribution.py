@@ -19,30 +19,28 @@ import Storm
 import sys
 sys.path.insert(0, "Y:/Scripts")
 import Logging
+import Common
 
 
 if __name__ == "__main__":
     Logging.logger.info("Script Execution Start")
 
-    # Sewer Stormwater
-    Logging.logger.info("Sewer Start")
-    Sewer.manholes()
-    Sewer.inlets()
-    Sewer.cleanouts()
-    Sewer.fittings()
-    Sewer.gravity_mains()
-    Logging.logger.info("Sewer Finish")
-
-    # Stormwater
-    Logging.logger.info("Storm Start")
-    Storm.manholes()
-    Storm.inlets()
-    Storm.cleanouts()
-    Storm.discharges()
-    Storm.culverts()
-    Storm.fittings()
-    Storm.gravity_mains()
-    Logging.logger.info("Storm Start")
+    # Point assets and culverts of both systems are separate feature classes so they're attributed in parallel; the mains need their names so they go last
+    # Both systems share one SDE server, so the pool stays within the smaller of the two scripts' worker limits
+    point_assets = [("Sewer", "manholes"), ("Sewer", "inlets"), ("Sewer", "cleanouts"), ("Sewer", "fittings"),
+                    ("Storm", "manholes"), ("Storm", "inlets"), ("Storm", "cleanouts"), ("Storm", "discharges"), ("Storm", "fittings"),
+                    ("Storm", "culverts")]
+    with Common.worker_pool(min(len(point_assets), Sewer.worker_count, Storm.worker_count)) as executor:
+        Logging.logger.info("Point Assets Start")
+        for future in [executor.submit(Common.attribute_by_name, module_name, asset_name) for module_name, asset_name in point_assets]:
+            future.result()
+        Logging.logger.info("Point Assets Finish")
+
+        # Sewer and storm mains are in different datasets so both run at once
+        Logging.logger.info("Mains Start")
+        for future in [executor.submit(Common.attribute_by_name, "Sewer", "gravity_mains"), executor.submit(Common.attribute_by_name, "Storm", "gravity_mains")]:
+            future.result()
+        Logging.logger.info("Mains Finish")
 
     # GPS Points
     Logging.logger.info("GPS Start")
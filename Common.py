@@ -0,0 +1,236 @@
+"""
+ SYNOPSIS
+
+     Common
+
+ DESCRIPTION
+
+    * Field calculator and template functions shared by the Sewer, Storm and GPS attribution scripts
+    * Imported by each script; not meant to be run on its own
+
+ REQUIREMENTS
+
+     Python 3
+     arcpy
+ """
+
+import arcpy
+import concurrent.futures
+import contextlib
+import functools
+import importlib
+import logging.handlers
+import multiprocessing
+import os
+import traceback
+import sys
+sys.path.insert(0, "Y:/Scripts")
+import Logging
+
+# Paths - Geodatabase
+geodatabase_services_folder = "Z:\\"
+sde = os.path.join(geodatabase_services_folder, r"DatabaseConnections\COSPW@imSPFLD@MCWINTCWDB.sde")
+
+# Paths - Engineering
+sewer_engineering = os.path.join(sde, "SewerEngineering")
+gps_nodes = os.path.join(sewer_engineering, "gpsNode")
+
+
+# Field calculator functions
+def spatial_id(x, y):
+    # Digits 3-4, 5 and 6-7 of the 7 digit State Plane coordinates, taken with integer math instead of string slicing
+    x, y = int(x), int(y)
+    return f"{x // 1000 % 100:02}{y // 1000 % 100:02}-{x // 100 % 10}{y // 100 % 10}-{x % 100:02}{y % 100:02}"
+
+
+def spatial_id_line(start, end):
+    return f"{start}_{end}"
+
+
+def copy_value(value):
+    return value
+
+
+# The same calculations as SQL Server expressions over the source field names, for running them as one UPDATE on the database
+def spatial_id_sql(x, y):
+    x, y = f"CAST(CAST({x} AS BIGINT) AS VARCHAR(20))", f"CAST(CAST({y} AS BIGINT) AS VARCHAR(20))"
+    return f"SUBSTRING({x}, 3, 2) + SUBSTRING({y}, 3, 2) + '-' + SUBSTRING({x}, 5, 1) + SUBSTRING({y}, 5, 1) + '-' + RIGHT({x}, 2) + RIGHT({y}, 2)"
+
+
+def spatial_id_line_sql(start, end):
+    return f"{start} + '_' + {end}"
+
+
+# Calculate Geometry Attributes properties as the vertex and axis they're read from
+geometry_properties = {
+    "POINT_X": ("firstPoint", "X"),
+    "POINT_Y": ("firstPoint", "Y"),
+    "LINE_START_X": ("firstPoint", "X"),
+    "LINE_START_Y": ("firstPoint", "Y"),
+    "LINE_END_X": ("lastPoint", "X"),
+    "LINE_END_Y": ("lastPoint", "Y")
+}
+
+
+def location_key(x, y):
+    # The millimeter grid cell a location falls in, as whole millimeters so neighbouring cells are exact
+    return round(x * 1000), round(y * 1000)
+
+
+def location_lookup(locations, x, y):
+    # Find the value stored for a location within about a millimeter; two points that close can round into neighbouring cells, so those are checked after the point's own cell
+    key_x, key_y = location_key(x, y)
+    for offset_x, offset_y in [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]:
+        value = locations.get((key_x + offset_x, key_y + offset_y))
+        if value is not None:
+            return value
+    return None
+
+
+# Template functions
+def edit_session(input_feature):
+    # Make an asset's edits to its feature class in one edit session that is aborted if anything fails, in the session mode that matches the data.
+    # Tables the SQL path updates get no session: its UPDATEs run on a separate connection that the session could neither roll back nor share rows with
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if sql_updatable(input_feature):
+                return function(*args, **kwargs)
+            with arcpy.da.Editor(sde, multiuser_mode=describe(input_feature).isVersioned):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@functools.lru_cache(maxsize=None)
+def describe(input_feature):
+    # Describe each feature class and the database once per run instead of on every call
+    return arcpy.Describe(input_feature)
+
+
+@functools.lru_cache(maxsize=None)
+def sde_connection():
+    # Open one SQL connection to the database and reuse it for every update
+    return arcpy.ArcSDESQLExecute(sde)
+
+
+def has_nulls(input_feature, selection):
+    with arcpy.da.SearchCursor(input_feature, ["OID@"], selection) as cursor:
+        return next(cursor, None) is not None
+
+
+def needs_attribution(input_feature, selections, z_field=None):
+    # Whether any feature matches one of the selections an asset function fills fields in, or is missing a Z that a GPS node can fill
+    if has_nulls(input_feature, " OR ".join(f"({selection})" for selection in selections)):
+        return True
+    return z_field is not None and has_z_matches(input_feature, z_field)
+
+
+def count_rows(input_feature, selection):
+    # Count the features matching a selection with a cursor instead of running Get Count
+    with arcpy.da.SearchCursor(input_feature, ["OID@"], selection) as cursor:
+        return sum(1 for row in cursor)
+
+
+def sql_updatable(input_feature):
+    # Whether a feature class is an unversioned, unarchived SDE table that plain SQL can update
+    description = describe(input_feature)
+    return describe(sde).workspaceType == "RemoteDatabase" and not description.isVersioned and not description.isArchived
+
+
+def sql_spatial_update(input_feature, field_name, expression, selection):
+    # Run the calculation as one UPDATE on the database; return None to fall back to a cursor for tables it isn't safe on
+    if not sql_updatable(input_feature):
+        return None
+    description = describe(input_feature)
+    source_fields, function, sql_function = expression
+    calculated_count = int(sde_connection().execute(f"SELECT COUNT(*) FROM {description.name} WHERE {selection}"))
+    if calculated_count > 0:
+        sde_connection().execute(f"UPDATE {description.name} SET {field_name} = {sql_function(*source_fields)} WHERE {selection}")
+    return calculated_count
+
+
+def template_geometry_calculator(input_feature, geometry_list):
+    # Fill every [field, geometry property] pair in one update cursor pass over features missing any of them, reading the coordinates straight off each shape
+    field_names = ", ".join(field[0] for field in geometry_list)
+    selection = " OR ".join(f"{field[0]} IS NULL" for field in geometry_list)
+    vertices = [geometry_properties[field[1]] for field in geometry_list]
+    calculated_count = 0
+    with arcpy.da.UpdateCursor(input_feature, ["SHAPE@"] + [field[0] for field in geometry_list], selection) as cursor:
+        for row in cursor:
+            if row[0] is None:
+                continue
+            cursor.updateRow([row[0]] + [getattr(getattr(row[0], vertex), axis) for vertex, axis in vertices])
+            calculated_count += 1
+    if calculated_count > 0:
+        Logging.logger.info("---------FINISH %s - COUNT=%s", field_names, calculated_count)
+    else:
+        Logging.logger.info("---------PASS %s - COUNT=0", field_names)
+
+
+@functools.lru_cache(maxsize=None)
+def gps_elevations():
+    # Map each GPS node's location to its elevation once and share it between every asset's Z calculation
+    with arcpy.da.SearchCursor(gps_nodes, ["SHAPE@XY", "NAVD88Z"], "NAVD88Z IS NOT NULL") as cursor:
+        return {location_key(*row[0]): row[1] for row in cursor}
+
+
+def has_z_matches(input_feature, field_name):
+    # Whether any feature missing its Z sits on a GPS node with an elevation
+    elevations = gps_elevations()
+    with arcpy.da.SearchCursor(input_feature, ["SHAPE@XY"], f"{field_name} IS NULL") as cursor:
+        return any(row[0][0] is not None and location_lookup(elevations, *row[0]) is not None for row in cursor)
+
+
+def template_geometry_z_calculator(input_feature, field_name):
+    if has_nulls(input_feature, f"{field_name} IS NULL"):
+        # Look up each null feature's location in the GPS node elevations
+        elevations = gps_elevations()
+        calculated_count = 0
+        with arcpy.da.UpdateCursor(input_feature, ["SHAPE@XY", field_name], f"{field_name} IS NULL") as cursor:
+            for row in cursor:
+                if row[0][0] is None:
+                    continue
+                elevation = location_lookup(elevations, *row[0])
+                if elevation is not None:
+                    cursor.updateRow([row[0], elevation])
+                    calculated_count += 1
+        Logging.logger.info("---------FINISH %s - COUNT=%s", field_name, calculated_count)
+    else:
+        Logging.logger.info("---------PASS %s - COUNT=0", field_name)
+
+
+def attribute_safely(asset):
+    # Run one asset function, logging its failure instead of letting it stop the assets after it
+    try:
+        asset()
+    except arcpy.ExecuteError:
+        Logging.logger.error(arcpy.GetMessages(2))
+    except Exception:
+        Logging.logger.error(traceback.format_exc())
+
+
+def attribute_by_name(module_name, asset_name):
+    # Look an asset function up by its script and name inside the worker process; the decorated functions themselves may not pickle
+    attribute_safely(getattr(importlib.import_module(module_name), asset_name))
+
+
+def log_to_queue(log_queue):
+    # Replace a worker's own log file handlers with one that hands its records back to the parent process
+    for handler in list(Logging.logger.handlers):
+        Logging.logger.removeHandler(handler)
+        handler.close()
+    Logging.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+@contextlib.contextmanager
+def worker_pool(max_workers):
+    # Process pool whose workers log through a queue so only the parent writes to, and rolls over, the shared log file
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *Logging.logger.handlers, respect_handler_level=True)
+    listener.start()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=log_to_queue, initargs=(log_queue,)) as executor:
+            yield executor
+    finally:
+        listener.stop()
@@ -23,6 +23,7 @@ import re
 import sys
 sys.path.insert(0, "Y:/Scripts")
 import Logging
+import Common
 
 # Paths - Geodatabase
 geodatabase_services_folder = "Z:\\"
@@ -34,10 +35,6 @@ engineering = os.path.join(sde, "SewerEngineering")
 gps_points = os.path.join(engineering, "gpsNode")
 shape_folder = "V:\\"
 
-# Expressions
-spatial_id_point = "str(int(!NAD83X!))[2:4] + str(int(!NAD83Y!))[2:4] + '-' + str(int(!NAD83X!))[4] + str(int(!NAD83Y!))[4] + '-' + str(int(!NAD83X!))[-2:] + str(int(!NAD83Y!))[-2:]"
-
-
 def gps_attribution():
     """Append new GPS shapefiles in the Y: drive to the gpsNode feature class on the SDE then calculate their facility ID
 
@@ -91,7 +88,16 @@ def gps_attribution():
                                             fr'CVCOND "Cover Condition" true true false 10 Text 0 0,First,#;'
                                             fr'COMMENTS "Additional Info" true true false 100 Text 0 0,First,#,{file_path},COMMENTS,0,18;'
                                             fr'GEOID "GEOID" true true false 20 Text 0 0,First,#', '', '')
-        arcpy.CalculateField_management(gps_points, "SPATIALID", spatial_id_point, "PYTHON3")
+
+        @Common.edit_session(gps_points)
+        def update_spatial_ids():
+            with arcpy.da.UpdateCursor(gps_points, ["NAD83X", "NAD83Y", "SPATIALID"], "NAD83X IS NOT NULL AND NAD83Y IS NOT NULL") as cursor:
+                for row in cursor:
+                    new_spatial_id = Common.spatial_id(row[0], row[1])
+                    if row[2] != new_spatial_id:
+                        cursor.updateRow([row[0], row[1], new_spatial_id])
+
+        update_spatial_ids()
         Logging.logger.info(f"---FINISH Append and Spatial ID - COUNT={folder_list_length}")
 
         Logging.logger.info(f"---START Update Last_Updated")
@@ -106,16 +112,13 @@ def gps_attribution():
 
 
 if __name__ == "__main__":
-    traceback_info = traceback.format_exc()
     try:
         Logging.logger.info("Script Execution Started")
         gps_attribution()
         Logging.logger.info("Script Execution Finished")
-    except (IOError, NameError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
-        Logging.logger.info(traceback_info)
-    except NameError:
-        print(traceback_info)
+    except (IOError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
+        Logging.logger.info(traceback.format_exc())
     except arcpy.ExecuteError:
         Logging.logger.error(arcpy.GetMessages(2))
     except:
-        Logging.logger("An unspecified exception occurred")
+        Logging.logger.info("An unspecified exception occurred\n%s", traceback.format_exc())
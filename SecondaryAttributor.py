@@ -6,11 +6,13 @@
  DESCRIPTION
 
     * Attributes location based fields such as wards or sewer districts
+    * Remembers a fingerprint of each polygon layer between runs; if the polygons are unchanged, only assets edited since the last run are attributed
 
  REQUIREMENTS
 
      Python 3
      arcpy
+     numpy
      natsort
  """
 
@@ -18,9 +20,13 @@ import arcpy
 import traceback
 import os
 import re
+import pickle
+import datetime
+import numpy
 import sys
 sys.path.insert(0, "Y:/Scripts")
 import Logging
+import Common
 
 # Paths - Geodatabase
 geodatabase_services_folder = "Z:\\"
@@ -28,16 +34,100 @@ sde = os.path.join(geodatabase_services_folder, r"DatabaseConnections\COSPW@imSP
 data = os.path.join(geodatabase_services_folder, "Data")
 attributor = os.path.join(data, "Attributor.gdb")
 
+# Paths - Temporary
+center_in_join = r"memory\CenterInJoin"
+
+# Paths - Cache
+cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SecondaryAttributor.pickle")
+
 # Environment
 arcpy.env.overwriteOutput = True
+arcpy.env.workspace = "memory"
 
 # Common feature classes and selecting edited assets
 sewer = os.path.join(sde, "SewerStormwater")
 sewer_main = os.path.join(sewer, "ssGravityMain")
 sewer_manhole = os.path.join(sewer, "ssManhole")
-arcpy.MakeFeatureLayer_management(sewer_main, "asset_temp_mains")
-arcpy.MakeFeatureLayer_management(sewer_manhole, "asset_temp_manholes")
-sewer_assets = ["asset_temp_mains", "asset_temp_manholes"]
+sewer_assets = {"asset_temp_mains": sewer_main, "asset_temp_manholes": sewer_manhole}
+layer_queries = {}  # Definition query each asset layer was last made with, so it's only rebuilt when the query changes
+
+# Fingerprints of the polygon layers from the last successful run and the ones taken during this run, which started now
+if os.path.exists(cache_file):
+    with open(cache_file, "rb") as cache:
+        last_run = pickle.load(cache)
+else:
+    last_run = {"timestamp": None, "fingerprints": {}}
+current_fingerprints = {}
+run_started = datetime.datetime.now(datetime.timezone.utc)
+
+
+def fingerprint(feature_class):
+    """Summarize a feature class as (row count, highest OID, latest edit date) so changes can be detected between runs."""
+
+    description = arcpy.Describe(feature_class)
+    fields = ["OID@", description.editedAtFieldName] if description.editorTrackingEnabled else ["OID@"]
+    with arcpy.da.SearchCursor(feature_class, fields) as cursor:
+        rows = [row for row in cursor]
+    object_ids = [row[0] for row in rows]
+    edit_dates = [row[1] for row in rows if len(row) > 1 and row[1] is not None]
+    return len(rows), max(object_ids, default=None), max(edit_dates, default=None)
+
+
+def select_edited_assets(polygons):
+    """Point the asset layers at the assets to attribute; if the polygons match the last run only assets edited since then are kept in the layers."""
+
+    polygon_fingerprint = fingerprint(polygons)
+    current_fingerprints[polygons] = polygon_fingerprint
+    unchanged = last_run["timestamp"] is not None and last_run["fingerprints"].get(polygons) == polygon_fingerprint
+
+    for asset, feature_class in sewer_assets.items():
+        description = arcpy.Describe(feature_class)
+        if unchanged and description.editorTrackingEnabled:
+            cutoff = last_run["timestamp"] if description.isTimeInUTC else last_run["timestamp"].astimezone()
+            query = f"{arcpy.AddFieldDelimiters(feature_class, description.editedAtFieldName)} > '{cutoff:%Y-%m-%d %H:%M:%S}'"
+        else:
+            query = ""
+        if layer_queries.get(asset) != query:
+            arcpy.MakeFeatureLayer_management(feature_class, asset, query)
+            layer_queries[asset] = query
+        Logging.logger.info(f"------{'Incremental' if unchanged else 'Full'} {asset}")
+
+
+def write_values(asset, field_name, values):
+    """Write a {OID: value} dictionary to an asset layer's text field in one pass by joining it onto its feature class as a NumPy array inside an edit session, skipping values that are already correct."""
+
+    with arcpy.da.SearchCursor(asset, ["OID@", field_name]) as cursor:
+        for row in cursor:
+            if values.get(row[0], row[1]) == row[1]:
+                values.pop(row[0], None)
+    Logging.logger.info("---------FINISH %s %s - COUNT=%s", asset, field_name, len(values))
+    if not values:
+        return
+    feature_class = sewer_assets[asset]
+    oid_field = arcpy.Describe(feature_class).OIDFieldName
+    text_length = max(len(value) for value in values.values())
+    array = numpy.array(list(values.items()), dtype=[("JOIN_OID", "i4"), (field_name, f"U{text_length}")])
+    Common.edit_session(feature_class)(arcpy.da.ExtendTable)(feature_class, oid_field, array, "JOIN_OID", append_only=False)
+
+
+def save_fingerprints():
+    """Store this run's polygon fingerprints and starting time; assets edited after this time, including during this run, are picked up next run."""
+
+    with open(cache_file, "wb") as cache:
+        pickle.dump({"timestamp": run_started, "fingerprints": current_fingerprints}, cache)
+
+
+def attribute_by_center_in(polygons, label_field, target_field, asset_layers, transform=str):
+    """Attribute the target field of each asset layer using the label field of the polygon its center is in, passing each label through transform first."""
+
+    select_edited_assets(polygons)
+    for asset in asset_layers:
+        arcpy.SpatialJoin_analysis(asset, polygons, center_in_join, "JOIN_ONE_TO_ONE", "KEEP_COMMON",
+                                   f"LABEL 'Label' true true false 255 Text 0 0,First,#,{polygons},{label_field},0,255", "HAVE_THEIR_CENTER_IN")
+        with arcpy.da.SearchCursor(center_in_join, ["TARGET_FID", "LABEL"]) as cursor:
+            labels = {row[0]: transform(row[1]) for row in cursor}
+        write_values(asset, target_field, labels)
+    arcpy.Delete_management(center_in_join)
 
 
 @Logging.insert("Wards", 1)
@@ -48,16 +138,12 @@ def ward():
     area = os.path.join(attributor, "AdministrativeArea")  # Townships and wards polygon
 
     # Attribution
-    with arcpy.da.SearchCursor(area, ["OID@", "Label"]) as cursor:
-        for row in cursor:
-            if re.search(fr"\bWard\b", str(row[1])):
-                city = f"'Springfield ({row[1]})'"
-            else:
-                city = f"'{row[1]}'"
-            selection = arcpy.SelectLayerByAttribute_management(area, "NEW_SELECTION", f"OBJECTID = {row[0]}")
-            sewer_selection = arcpy.SelectLayerByLocation_management("asset_temp_mains", "HAVE_THEIR_CENTER_IN", selection, None, "NEW_SELECTION")
-            arcpy.CalculateField_management(sewer_selection, "GXPCity", f"{city}", "PYTHON3")
-    del cursor
+    def city(label):
+        if re.search(fr"\bWard\b", str(label)):
+            return f"Springfield ({label})"
+        return f"{label}"
+
+    attribute_by_center_in(area, "Label", "GXPCity", ["asset_temp_mains"], city)
 
 
 @Logging.insert("Sewer Districts", 1)
@@ -69,12 +155,7 @@ def sewer_districts():
     districts = os.path.join(engineering, "ssSewerDistrict")
 
     # Attribution
-    with arcpy.da.SearchCursor(districts, ["OID@", "NAME"]) as cursor:
-        for row in cursor:
-            selection = arcpy.SelectLayerByAttribute_management(districts, "NEW_SELECTION", f"OBJECTID = {row[0]}")
-            for asset in sewer_assets:
-                sewer_selection = arcpy.SelectLayerByLocation_management(asset, "HAVE_THEIR_CENTER_IN", selection, None, "NEW_SELECTION")
-                arcpy.CalculateField_management(sewer_selection, "DISTRICT", f"'{row[1]}'", "PYTHON3")
+    attribute_by_center_in(districts, "NAME", "DISTRICT", sewer_assets)
 
 
 @Logging.insert("Sewer Plants", 1)
@@ -85,12 +166,7 @@ def sewer_plants():
     plants = os.path.join(attributor, "TreatmentPlants")
 
     # Attribution
-    with arcpy.da.SearchCursor(plants, ["OID@", "NAME"]) as cursor:
-        for row in cursor:
-            selection = arcpy.SelectLayerByAttribute_management(plants, "NEW_SELECTION", f"OBJECTID = {row[0]}")
-            for asset in sewer_assets:
-                sewer_selection = arcpy.SelectLayerByLocation_management(asset, "HAVE_THEIR_CENTER_IN", selection, None, "NEW_SELECTION")
-                arcpy.CalculateField_management(sewer_selection, "PLANT", f"'{row[1]}'", "PYTHON3")
+    attribute_by_center_in(plants, "NAME", "PLANT", sewer_assets)
 
 
 @Logging.insert("Detention Ponds", 1)
@@ -102,25 +178,35 @@ def detention_ponds():
     detention_areas = os.path.join(storm, "swDetention")
 
     # Attribution
-    facility_id = "str(!SHAPE!.centroid.X)[2:4] + str(!SHAPE!.centroid.Y)[2:4] + '-' + str(!SHAPE!.centroid.X)[4] + str(!SHAPE!.centroid.Y)[4] + '-' + " \
-                  "str(!SHAPE!.centroid.X)[-2:] + str(!SHAPE!.centroid.Y)[-2:]"
-    arcpy.CalculateField_management(detention_areas, "FACILITYID", facility_id, "PYTHON3")
+    def facility_id(centroid):
+        x, y = str(centroid.X), str(centroid.Y)
+        return x[2:4] + y[2:4] + '-' + x[4] + y[4] + '-' + x[-2:] + y[-2:]
+
+    @Common.edit_session(detention_areas)
+    def update_facility_ids():
+        with arcpy.da.UpdateCursor(detention_areas, ["SHAPE@", "FACILITYID"]) as cursor:
+            for row in cursor:
+                if row[0] is None:
+                    continue
+                new_facility_id = facility_id(row[0].centroid)
+                if row[1] != new_facility_id:
+                    cursor.updateRow([row[0], new_facility_id])
+
+    update_facility_ids()
 
 
 if __name__ == "__main__":
-    traceback_info = traceback.format_exc()
     try:
         Logging.logger.info("Script Execution Started")
         ward()
         sewer_districts()
         sewer_plants()
         detention_ponds()
+        save_fingerprints()
         Logging.logger.info("Script Execution Finished")
-    except (IOError, NameError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
-        Logging.logger.info(traceback_info)
-    except NameError:
-        print(traceback_info)
+    except (IOError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
+        Logging.logger.info(traceback.format_exc())
     except arcpy.ExecuteError:
         Logging.logger.error(arcpy.GetMessages(2))
     except:
-        Logging.logger.info("An unspecified exception occurred")
+        Logging.logger.info("An unspecified exception occurred\n%s", traceback.format_exc())
@@ -11,6 +11,7 @@
     * Fully automated
     * Checks only null values and only performs an operation if more than 0 features need operated on
     * Comprehensive logging
+    * Each asset's edits are made in a single edit operation
     * Error logging
     * Fields to calculate (name may not reflect the actual field name):
         1. For point assets:
@@ -32,32 +33,13 @@
  """
 
 import arcpy
+import functools
 import os
 import traceback
 import sys
 sys.path.insert(0, "Y:/Scripts")
 import Logging
-
-# Global variables for manhole naming: increment function for field calculation and a dummy global maximum number
-increment_function = """index = 0
-def increment(map_section, maximum, type=None):
-    global index
-    global current_maximum_number
-    start = 1
-
-    if index == 0:
-        index = start
-    else:
-        index += 1
-
-    new_maximum_number = maximum + index
-    if type == "cleanouts":
-        new_name = f"{map_section}{new_maximum_number:03}C"
-    else:
-        new_name = f"{map_section}{new_maximum_number:03}"
-    print(f"{index} + {maximum} = {new_name}")
-    return new_name"""
-current_maximum_number_cleanouts = 0
+import Common
 
 # Paths - Geodatabase
 geodatabase_services_folder = "Z:\\"
@@ -74,424 +56,336 @@ sewer_inlets = os.path.join(sewer_dataset, "ssInlet")
 cadastral_dataset = os.path.join(sde, "CadastralReference")
 quarter_sections = os.path.join(cadastral_dataset, "PLSSQuarterSection")
 
-# Paths - Engineering
-sewer_engineering = os.path.join(sde, "SewerEngineering")
-gps_nodes = os.path.join(sewer_engineering, "gpsNode")
 
-# Field calculator expressions
-spatial_start = "str(int(!NAD83XSTART!))[2:4] + str(int(!NAD83YSTART!))[2:4] + '-' + str(int(!NAD83XSTART!))[4] + " \
-                "str(int(!NAD83YSTART!))[4] + '-' + str(int(!NAD83XSTART!))[-2:] + str(int(!NAD83YSTART!))[-2:]"
-spatial_end = "str(int(!NAD83XEND!))[2:4] + str(int(!NAD83YEND!))[2:4] + '-' + str(int(!NAD83XEND!))[4] + str(int(!NAD83YEND!))[4] + '-' + str(int(!NAD83XEND!))[-2:] + str(int(!NAD83YEND!))[-2:]"
-spatial_id_line_sewer = "!SPATAILSTART! + '_' + !SPATAILEND!"  # Yes it's seriously misspelled
-spatial_id_line_sewer_storm = "!SPATAILSTART! + '_' + !SPATAILEND!"
-spatial_id_line_storm = "!SPATIALSTART! + '_' + !SPATIALEND!"
-spatial_id_point = "str(int(!NAD83X!))[2:4] + str(int(!NAD83Y!))[2:4] + '-' + str(int(!NAD83X!))[4] + str(int(!NAD83Y!))[4] + '-' + str(int(!NAD83X!))[-2:] + str(int(!NAD83Y!))[-2:]"
+# Field calculator functions and the source fields passed to them
+spatial_start = (["NAD83XSTART", "NAD83YSTART"], Common.spatial_id, Common.spatial_id_sql)
+spatial_end = (["NAD83XEND", "NAD83YEND"], Common.spatial_id, Common.spatial_id_sql)
+spatial_id_line_sewer = (["SPATAILSTART", "SPATAILEND"], Common.spatial_id_line, Common.spatial_id_line_sql)  # Yes it's seriously misspelled
+spatial_id_point = (["NAD83X", "NAD83Y"], Common.spatial_id, Common.spatial_id_sql)
+facility_id_spatial = (["SPATIALID"], Common.copy_value, Common.copy_value)
+
+# Owner-based selections for particular asset fields, looked up by (feature class, field); every other field uses "FACILITYID IS NULL"
+special_selections = {
+    (sewer_cleanouts, "FACILITYID"): "FACILITYID IS NULL AND OWNEDBY = -2",
+    (sewer_manholes, "FACILITYID"): "FACILITYID IS NULL AND OWNEDBY = -2",
+    (sewer_mains, "FROMMH"): "FROMMH IS NULL AND OWNEDBY = -2",
+    (sewer_mains, "TOMH"): "TOMH IS NULL AND OWNEDBY = -2"
+}
 
 # Environments
 arcpy.env.overwriteOutput = True
 
-
-# Template functions
-def template_geometry_calculator(input_feature, layer_name, field_name, geometry_name):
-    arcpy.MakeFeatureLayer_management(input_feature, layer_name, f"{field_name} IS NULL")
-    selected_nulls_count = arcpy.GetCount_management(layer_name).getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"---------START {field_name} - COUNT={selected_nulls_count}")
-        geometry_list = [[field_name, geometry_name]]
-        arcpy.CalculateGeometryAttributes_management(layer_name, geometry_list)
-        Logging.logger.info(f"---------FINISH {field_name} - COUNT={selected_nulls_count}")
-    else:
-        Logging.logger.info(f"---------PASS {field_name} - COUNT={selected_nulls_count}")
+# Parallel workers for the point assets; each one checks out its own arcpy license and SDE connection, so keep this within what the server allows
+worker_count = min(4, os.cpu_count() or 1)
 
 
-def template_geometry_z_calculator(input_feature, layer_name, field_name):
-    arcpy.MakeFeatureLayer_management(input_feature, layer_name, f"{field_name} IS NULL")
-    arcpy.MakeFeatureLayer_management(gps_nodes, "gps_nodes")
-    gps_identical = arcpy.SelectLayerByLocation_management("gps_nodes", "ARE_IDENTICAL_TO", layer_name)
-    selected_nulls_count = arcpy.GetCount_management(gps_identical).getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"---------START {field_name} - COUNT={selected_nulls_count}")
-        with arcpy.da.SearchCursor(gps_identical, ["OBJECTID", "NAVD88Z"]) as cursor:
+# Template functions
+@functools.lru_cache(maxsize=None)
+def feature_layer(input_feature):
+    # Make one layer per feature class and reuse it, changing only its selection
+    layer_name = f"{os.path.basename(input_feature)}_layer"
+    arcpy.MakeFeatureLayer_management(input_feature, layer_name)
+    return layer_name
+
+
+def calculate_expression(input_feature, field_name, expression, selection):
+    # Calculate the field with SQL when possible, otherwise with an update cursor; returns how many features were calculated
+    calculated_count = Common.sql_spatial_update(input_feature, field_name, expression, selection)
+    if calculated_count is None:
+        source_fields, function, sql_function = expression
+        calculated_count = 0
+        with arcpy.da.UpdateCursor(input_feature, source_fields + [field_name], selection) as cursor:
             for row in cursor:
-                selected_node = arcpy.SelectLayerByAttribute_management(gps_identical, "NEW_SELECTION", f"OBJECTID = {row[0]}")
-                selected_manhole = arcpy.SelectLayerByLocation_management(layer_name, "ARE_IDENTICAL_TO", selected_node)
-                arcpy.CalculateField_management(selected_manhole, field_name, f"{row[1]}", "PYTHON3")
-        Logging.logger.info(f"---------FINISH {field_name} - COUNT={selected_nulls_count}")
+                if None in row[:-1]:
+                    continue
+                row[-1] = function(*row[:-1])
+                cursor.updateRow(row)
+                calculated_count += 1
+    return calculated_count
+
+
+def template_spatial_calculator(input_feature, field_name, expression):
+    selection = special_selections.get((input_feature, field_name), "FACILITYID IS NULL")
+    calculated_count = calculate_expression(input_feature, field_name, expression, selection)
+    if calculated_count > 0:
+        Logging.logger.info("---------FINISH %s - COUNT=%s", field_name, calculated_count)
     else:
-        Logging.logger.info(f"---------PASS {field_name} - COUNT={selected_nulls_count}")
-
-
-def template_spatial_calculator(input_feature, layer_name, field_name, expression):
-    # Check if a special selection is given
-    if input_feature == sewer_cleanouts and field_name == "FACILITYID":
-        selection = "FACILITYID IS NULL AND OWNEDBY = -2"
-    elif input_feature == sewer_manholes and field_name == "FACILITYID":
-        selection = "FACILITYID IS NULL AND OWNEDBY = -2"
-    elif input_feature == sewer_mains and field_name == "FROMMH":
-        selection = "FROMMH IS NULL AND OWNEDBY = -2"
-    elif input_feature == sewer_mains and field_name == "TOMH":
-        selection = "TOMH IS NULL AND OWNEDBY = -2"
-    else:
-        selection = "FACILITYID IS NULL"
-    arcpy.MakeFeatureLayer_management(input_feature, layer_name, selection)
-    selected_nulls_count = arcpy.GetCount_management(layer_name).getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"---------START {field_name} - COUNT={selected_nulls_count}")
-        arcpy.CalculateField_management(layer_name, field_name, expression)
-        Logging.logger.info(f"---------FINISH {field_name} - COUNT={selected_nulls_count}")
+        Logging.logger.info("---------PASS %s - COUNT=%s", field_name, calculated_count)
+
+
+@functools.lru_cache(maxsize=None)
+def map_page_sections():
+    # Read the quarter sections' sanitized map pages, shapes and extents once and share them between every asset
+    with arcpy.da.SearchCursor(quarter_sections, ["SEWMAP", "SHAPE@"], "SEWMAP IS NOT NULL") as cursor:
+        return [(row[0].replace("-", ""), row[1], row[1].extent) for row in cursor]
+
+
+def template_map_page_calculator(input_feature, logging_name, null_selection, existing_selection, suffix="", id_length=None):
+    # id_length cuts existing IDs down to their map page and number before parsing, for assets whose IDs carry extra characters after the number
+    selected_nulls_count = Common.count_rows(input_feature, null_selection)
+    if selected_nulls_count > 0:
+        layer_name = feature_layer(input_feature)
+        arcpy.SelectLayerByAttribute_management(layer_name, "NEW_SELECTION", null_selection)
+        Logging.logger.info("---------START FACILITYID (%s) - COUNT=%s", logging_name, selected_nulls_count)
+
+        # Only the quarter sections overlapping the null assets' bounding box are candidates; assets without a shape can't be placed on a map page
+        with arcpy.da.SearchCursor(layer_name, ["OID@", "SHAPE@XY", "SHAPE@"]) as cursor:
+            null_assets = [row for row in cursor if row[1][0] is not None]
+        candidate_sections = []
+        if null_assets:
+            x_values, y_values = [row[1][0] for row in null_assets], [row[1][1] for row in null_assets]
+            x_min, x_max, y_min, y_max = min(x_values), max(x_values), min(y_values), max(y_values)
+            candidate_sections = [(section, polygon, extent) for section, polygon, extent in map_page_sections()
+                                  if extent.XMax >= x_min and extent.XMin <= x_max and extent.YMax >= y_min and extent.YMin <= y_max]
+
+        # Find the sanitized map page each null asset is within, testing extents before geometries
+        map_pages = {}
+        for object_id, (x, y), point in null_assets:
+            for section, polygon, extent in candidate_sections:
+                if extent.XMin <= x <= extent.XMax and extent.YMin <= y <= extent.YMax and polygon.contains(point):
+                    map_pages[object_id] = section
+                    break
+
+        # Find the highest last three digits of each map page in a single pass over the named assets; anchored LIKEs let the FACILITYID index be used
+        maximum_numbers = {section: 0 for section in set(map_pages.values())}
+        if maximum_numbers:
+            section_selection = " OR ".join(f"FACILITYID LIKE '{section}%' OR FACILITYID LIKE 'SD{section}%'" for section in maximum_numbers)
+            with arcpy.da.SearchCursor(input_feature, ["FACILITYID"], f"({section_selection}) AND {existing_selection}") as cursor:
+                for row in cursor:
+                    facility_id = row[0].replace("SD", "")[:id_length].rstrip(suffix)
+                    section = facility_id[:-3]
+                    if section not in maximum_numbers:
+                        continue
+                    try:
+                        maximum_numbers[section] = max(maximum_numbers[section], int(facility_id[-3:]))
+                    except ValueError:
+                        continue  # Hand-entered IDs without a numeric suffix don't count towards the maximum
+
+        # Name each null asset after its map page, incrementing the last three digits per feature
+        with arcpy.da.UpdateCursor(layer_name, ["OID@", "FACILITYID"]) as cursor:
+            for row in cursor:
+                if row[0] in map_pages:
+                    section = map_pages[row[0]]
+                    maximum_numbers[section] += 1
+                    cursor.updateRow([row[0], f"{section}{maximum_numbers[section]:03}{suffix}"])
+        Logging.logger.info("---------FINISH FACILITYID (%s) - COUNT=%s", logging_name, selected_nulls_count)
     else:
-        Logging.logger.info(f"---------PASS {field_name} - COUNT={selected_nulls_count}")
+        Logging.logger.info("---------PASS FACILITYID (%s) - COUNT=0", logging_name)
 
 
 # Asset functions
 @Logging.insert("Manholes", 1)
+@Common.edit_session(sewer_manholes)
 def manholes():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["manholes_null_x", "NAD83X", "POINT_X"],
-        ["manholes_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(sewer_manholes, field[0], field[1], field[2])
+    Common.template_geometry_calculator(sewer_manholes, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(sewer_manholes, "manholes_null_z", "NAVD88RIM")
+    Common.template_geometry_z_calculator(sewer_manholes, "NAVD88RIM")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["manholes_spatial_id", "SPATIALID", spatial_id_point],
-        ["manholes_facility_id", "FACILITYID", spatial_id_point],
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", facility_id_spatial],
     ]
 
     Logging.logger.info("------START Spatial Calculation")
     for field in spatial_fields_to_calculate:
-        template_spatial_calculator(sewer_manholes, field[0], field[1], field[2])
-
-    # Select all null manholes and quarter sections that contain it
-    selected_manholes = arcpy.SelectLayerByAttribute_management(sewer_manholes, "NEW_SELECTION", "FACILITYID IS NULL AND STAGE = 0 AND OWNEDBY = 1")
-    selected_quarter_sections = arcpy.SelectLayerByLocation_management(quarter_sections, "COMPLETELY_CONTAINS", selected_manholes)
-    selected_manholes_count = arcpy.GetCount_management(selected_manholes).getOutput(0)
-    if int(selected_manholes_count) > 0:
-        Logging.logger.info(f"---------START FACILITYID (Map Page) - COUNT={selected_manholes_count}")
-
-        # Create a list of quarter sections then sanitize it
-        quarter_section_list = []
-        with arcpy.da.SearchCursor(selected_quarter_sections, "SEWMAP") as cursor:
-            for row in cursor:
-                quarter_section_list.append(row[0])
-        sanitized_quarter_section_list = [(section, section.replace("-", "")) for section in quarter_section_list]
-
-        # Select all relevant manholes in the current quarter section
-        for section in sanitized_quarter_section_list:
-            selected_manholes_in_section = arcpy.SelectLayerByAttribute_management(sewer_manholes, "NEW_SELECTION", f"FACILITYID LIKE '%{section[1]}%' AND STAGE = 0")
-
-            # For the current quarter section, find the highest last three digits of selected manholes
-            if int(arcpy.GetCount_management(selected_manholes_in_section).getOutput(0)) > 0:
-                with arcpy.da.SearchCursor(selected_manholes_in_section, "FACILITYID") as maximum_cursor:
-                    current_maximum = max(maximum_cursor)
-                    current_maximum_number = int(current_maximum[0].replace("SD", "")[-3:])
-            else:
-                current_maximum_number = 0
-
-            # Select the null manholes inside the current quarter section
-            selected_quarter_sections = arcpy.SelectLayerByAttribute_management(quarter_sections, "NEW_SELECTION", f"SEWMAP LIKE '%{section[0]}%'")
-            selected_within_manholes = arcpy.SelectLayerByLocation_management(sewer_manholes, "COMPLETELY_WITHIN", selected_quarter_sections)
-            selected_null_manholes = arcpy.SelectLayerByAttribute_management(selected_within_manholes, "SUBSET_SELECTION", "FACILITYID IS NULL AND STAGE = 0 AND OWNEDBY = 1")
-
-            # Calculate the Facility IDs of each null manhole selected in the current quarter section, incrementing the last three digits per feature
-            arcpy.CalculateField_management(selected_null_manholes, "FACILITYID", f"increment('{section[1]}', {current_maximum_number})", "PYTHON3", increment_function)
-            arcpy.Delete_management("SewerManholes")
-        Logging.logger.info(f"---------FINISH FACILITYID (Map Page) - COUNT={selected_manholes_count}")
-    else:
-        Logging.logger.info(f"---------PASS FACILITYID (Map Page) - COUNT={selected_manholes_count}")
+        template_spatial_calculator(sewer_manholes, field[0], field[1])
+
+    # Map page Facility IDs for city-owned manholes
+    template_map_page_calculator(sewer_manholes, "Map Page", "FACILITYID IS NULL AND STAGE = 0 AND OWNEDBY = 1", "STAGE = 0")
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Inlets", 1)
+@Common.edit_session(sewer_inlets)
 def inlets():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["inlets_null_x", "NAD83X", "POINT_X"],
-        ["inlets_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(sewer_inlets, field[0], field[1], field[2])
+    Common.template_geometry_calculator(sewer_inlets, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(sewer_inlets, "inlets_null_z", "NAVD88INLET")
+    Common.template_geometry_z_calculator(sewer_inlets, "NAVD88INLET")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["inlets_null_spatial_id", "SPATIALID", spatial_id_point],
-        ["inlets_null_facility_id", "FACILITYID", spatial_id_point]
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", facility_id_spatial]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
     for field in spatial_fields_to_calculate:
-        template_spatial_calculator(sewer_inlets, field[0], field[1], field[2])
+        template_spatial_calculator(sewer_inlets, field[0], field[1])
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Cleanouts", 1)
+@Common.edit_session(sewer_cleanouts)
 def cleanouts():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["cleanouts_null_x", "NAD83X", "POINT_X"],
-        ["cleanouts_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(sewer_cleanouts, field[0], field[1], field[2])
+    Common.template_geometry_calculator(sewer_cleanouts, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(sewer_cleanouts, "cleanouts_null_z", "NAVD88LID")
+    Common.template_geometry_z_calculator(sewer_cleanouts, "NAVD88LID")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["cleanouts_spatial_id", "SPATIALID", spatial_id_point],
-        ["cleanouts_facility_id", "FACILITYID", spatial_id_point]
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", facility_id_spatial]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
     for field in spatial_fields_to_calculate:
-        template_spatial_calculator(sewer_cleanouts, field[0], field[1], field[2])
-
-    selected_cleanouts = arcpy.SelectLayerByAttribute_management(sewer_cleanouts, "NEW_SELECTION", "FACILITYID IS NULL AND OWNEDBY = 1")
-    selected_quarter_sections = arcpy.SelectLayerByLocation_management(quarter_sections, "COMPLETELY_CONTAINS", selected_cleanouts)
-    selected_cleanouts_count = arcpy.GetCount_management(selected_cleanouts).getOutput(0)
-    if int(selected_cleanouts_count) > 0:
-        Logging.logger.info(f"---------START FACILITYID (City) - COUNT={selected_cleanouts_count}")
+        template_spatial_calculator(sewer_cleanouts, field[0], field[1])
 
-        # Create a list of quarter sections then sanitize it
-        quarter_section_list = []
-        with arcpy.da.SearchCursor(selected_quarter_sections, "SEWMAP") as cursor:
-            for row in cursor:
-                quarter_section_list.append(row[0])
-        sanitized_quarter_section_list = [(section, section.replace("-", "")) for section in quarter_section_list]
-
-        # Select all relevant manholes in the current quarter section
-        for section in sanitized_quarter_section_list:
-            selected_cleanouts_in_section = arcpy.SelectLayerByAttribute_management(sewer_cleanouts, "NEW_SELECTION", f"FACILITYID LIKE '%{section[1]}%' AND STAGE = 0")
-
-            # For the current quarter section, find the highest last three digits of selected cleanouts
-            if int(arcpy.GetCount_management(selected_cleanouts_in_section).getOutput(0)) > 0:
-                with arcpy.da.SearchCursor(selected_cleanouts_in_section, "FACILITYID") as maximum_cursor:
-                    current_maximum = max(maximum_cursor)
-                    current_maximum_number = int(current_maximum[0].replace("SD", "")[-3:])
-            else:
-                current_maximum_number = 0
-
-            # Select the null cleanouts inside the current quarter section
-            selected_quarter_sections = arcpy.SelectLayerByAttribute_management(quarter_sections, "NEW_SELECTION", f"SEWMAP LIKE '%{section[0]}%'")
-            selected_within_cleanouts = arcpy.SelectLayerByLocation_management(sewer_cleanouts, "COMPLETELY_WITHIN", selected_quarter_sections)
-            selected_null_cleanouts = arcpy.SelectLayerByAttribute_management(selected_within_cleanouts, "SUBSET_SELECTION", "FACILITYID IS NULL AND OWNEDBY = 1")
-
-            # Calculate the Facility IDs of each null cleanouts selected in the current quarter section, incrementing the last three digits per feature using the function below (indentation is correct)
-            arcpy.CalculateField_management(selected_null_cleanouts, "FACILITYID", f"increment('{section[1]}', {current_maximum_number}, 'cleanouts')", "PYTHON3", increment_function)
-            arcpy.Delete_management("SewerCleanouts")
-        Logging.logger.info(f"---------FINISH FACILITYID (City) - COUNT={selected_cleanouts_count}")
-    else:
-        Logging.logger.info(f"---------PASS FACILITYID (City) - COUNT={selected_cleanouts_count}")
+    # Map page Facility IDs for city-owned cleanouts
+    template_map_page_calculator(sewer_cleanouts, "City", "FACILITYID IS NULL AND OWNEDBY = 1", "STAGE = 0", "C")
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Fittings", 1)
+@Common.edit_session(sewer_fittings)
 def fittings():
     """Calculate FACILITYID for sewer fittings"""
 
-    # Facility ID
-    selected_fittings = arcpy.SelectLayerByAttribute_management(sewer_fittings, "NEW_SELECTION", "FACILITYID IS NULL AND OWNEDBY = 1")
-    selected_quarter_sections = arcpy.SelectLayerByLocation_management(quarter_sections, "COMPLETELY_CONTAINS", selected_fittings)
-    selected_fittings_count = arcpy.GetCount_management(selected_fittings).getOutput(0)
-    if int(selected_fittings_count) > 0:
-        Logging.logger.info(f"---------START FACILITYID - COUNT={selected_fittings_count}")
-
-        # Create a list of quarter sections with unnamed assets inside then sanitize it
-        quarter_section_list = []
-        with arcpy.da.SearchCursor(selected_quarter_sections, "SEWMAP") as cursor:
-            for row in cursor:
-                quarter_section_list.append(row[0])
-        sanitized_quarter_section_list = [(section, section.replace("-", "")) for section in quarter_section_list]
-
-        # Select all relevant manholes in the current quarter section
-        for section in sanitized_quarter_section_list:
-            selected_fittings_in_section = arcpy.SelectLayerByAttribute_management(sewer_fittings, "NEW_SELECTION", f"FACILITYID LIKE '%{section[1]}%'")
-
-            # For the current quarter section, find the highest last three digits of selected cleanouts
-            if int(arcpy.GetCount_management(selected_fittings_in_section).getOutput(0)) > 0:
-                with arcpy.da.SearchCursor(selected_fittings_in_section, "FACILITYID") as maximum_cursor:
-                    current_maximum = max(maximum_cursor)
-                    current_maximum_number = int(current_maximum[0].replace("SD", "")[:9][-3:])
-
-            else:
-                current_maximum_number = 0
-
-            # Select the null cleanouts inside the current quarter section
-            selected_quarter_sections = arcpy.SelectLayerByAttribute_management(quarter_sections, "NEW_SELECTION", f"SEWMAP LIKE '%{section[0]}%'")
-            selected_within_fittings = arcpy.SelectLayerByLocation_management(sewer_fittings, "COMPLETELY_WITHIN", selected_quarter_sections)
-            selected_null_fittings = arcpy.SelectLayerByAttribute_management(selected_within_fittings, "SUBSET_SELECTION", "FACILITYID IS NULL AND OWNEDBY = 1")
-
-            # Calculate the Facility IDs of each null fittings selected in the current quarter section, incrementing the last three digits per feature using the function below (indentation is correct)
-            arcpy.CalculateField_management(selected_null_fittings, "FACILITYID", f"increment('{section[1]}', {current_maximum_number})", "PYTHON3", increment_function)
-            arcpy.Delete_management("SewerFittings")
-        Logging.logger.info(f"---------FINISH FACILITYID - COUNT={selected_fittings_count}")
-    else:
-        Logging.logger.info(f"---------PASS FACILITYID - COUNT={selected_fittings_count}")
+    # Map page Facility IDs for city-owned fittings
+    template_map_page_calculator(sewer_fittings, "Map Page", "FACILITYID IS NULL AND OWNEDBY = 1", "FACILITYID IS NOT NULL", id_length=9)
 
 
 @Logging.insert("Gravity Mains", 1)
+@Common.edit_session(sewer_mains)
 def gravity_mains():
     """Calculate fields for sewer gravity mains"""
 
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["mains_null_x_start", "NAD83XSTART", "LINE_START_X"],
-        ["mains_null_y_start", "NAD83YSTART", "LINE_START_Y"],
-        ["mains_null_x_end", "NAD83XEND", "LINE_END_X"],
-        ["mains_null_y_end", "NAD83YEND", "LINE_END_Y"]]
+        ["NAD83XSTART", "LINE_START_X"],
+        ["NAD83YSTART", "LINE_START_Y"],
+        ["NAD83XEND", "LINE_END_X"],
+        ["NAD83YEND", "LINE_END_Y"]]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(sewer_mains, field[0], field[1], field[2])
+    Common.template_geometry_calculator(sewer_mains, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["null_frommh", "FROMMH", spatial_start],
-        ["null_tomh", "TOMH", spatial_end],
-        ["null_spatial_start", "SPATAILSTART", spatial_start],
-        ["null_spatial_end", "SPATAILEND", spatial_end],
-        ["null_spatial_id", "SPATIALID", spatial_id_line_sewer]
+        ["FROMMH", spatial_start],
+        ["TOMH", spatial_end],
+        ["SPATAILSTART", spatial_start],
+        ["SPATAILEND", spatial_end],
+        ["SPATIALID", spatial_id_line_sewer]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
     for field in spatial_fields_to_calculate:
-        template_spatial_calculator(sewer_mains, field[0], field[1], field[2])
-
-    # Paths
-    attributor = os.path.join(data, "Attributor.gdb")
-    start_vertices = os.path.join(attributor, "SewerStartVertices")
-    start_join = os.path.join(attributor, "SewerStartJoin")
-    end_vertices = os.path.join(attributor, "SewerEndVertices")
-    end_join = os.path.join(attributor, "SewerEndJoin")
-
-    # Delete existing temp feature classes
-    Logging.logger.info("---------START DELETE Temp")
-    if arcpy.Exists(start_vertices):
-        arcpy.Delete_management(start_vertices)
-    if arcpy.Exists(end_vertices):
-        arcpy.Delete_management(end_vertices)
-    if arcpy.Exists(start_join):
-        arcpy.Delete_management(start_join)
-    if arcpy.Exists(end_join):
-        arcpy.Delete_management(end_join)
-    Logging.logger.info("---------FINISH DELETE Temp")
-
-    # WIP for allowing endpoints to be more than just manholes
-    def endpoint_naming(input_feature, direction, logging_name):
-
-        # Upstream or downstream variables
-        if direction == "upstream":
-            expression = "FROMMH IS NULL AND STAGE = 0 AND OWNEDBY = 1 AND (WATERTYPE = 'SS' OR WATERTYPE ='CB')"
-            join_output = start_join
-            join_string = "START"
-            join_layer = "StartJoin"
-            vertices_output = start_vertices
-            field_to_calculate = "FROMMH"
-        elif direction == "downstream":
-            expression = "TOMH IS NULL AND STAGE = 0 AND OWNEDBY = 1 AND (WATERTYPE = 'SS' OR WATERTYPE ='CB')"
-            join_output = end_join
-            join_string = "END"
-            join_layer = "EndJoin"
-            vertices_output = end_vertices
-            field_to_calculate = "TOMH"
-        else:
-            raise ValueError("No direction")
-
-        arcpy.MakeFeatureLayer_management(sewer_mains, "sewer_mains_null", f"{expression}")
-        selected_null_count = arcpy.GetCount_management("sewer_mains_null").getOutput(0)
-        if int(selected_null_count) > 0:
-            Logging.logger.info(f"---------START {field_to_calculate} for {logging_name} - COUNT={selected_null_count}")
-            arcpy.FeatureVerticesToPoints_management("sewer_mains_null", vertices_output, join_string)
-            selected_intersecting_features = arcpy.SelectLayerByLocation_management(input_feature, "INTERSECT", vertices_output)
-            arcpy.SpatialJoin_analysis(selected_intersecting_features, vertices_output, join_output, "JOIN_ONE_TO_MANY", "KEEP_COMMON",
-                                       f"FACILITYID 'Facility ID' true true false 20 Text 0 0,First,#,{input_feature},FACILITYID,0,20;"
-                                       f"ORIG_FID 'ORIG_FID' true true false 4 Long 0 0,First,#,{vertices_output},ORIG_FID,-1,-1")
-            arcpy.MakeFeatureLayer_management(join_output, join_layer)
-
-            with arcpy.da.SearchCursor(join_layer, ["ORIG_FID", "FACILITYID"]) as cursor:
-                for feature in cursor:
-                    print(f"------------MAIN - {feature[0]};{feature[1]}")
-                    selected_target_feature = arcpy.SelectLayerByAttribute_management(sewer_mains, "NEW_SELECTION", f"OBJECTID = {feature[0]}")
-                    arcpy.CalculateField_management(selected_target_feature, f"{field_to_calculate}", f"'{feature[1]}'", "PYTHON3")
-            Logging.logger.info(f"---------FINISH {field_to_calculate} - COUNT={selected_null_count}")
+        template_spatial_calculator(sewer_mains, field[0], field[1])
+
+    # Endpoint naming: map each named manhole, cleanout and fitting location to its Facility ID; manholes take precedence, then cleanouts, then fittings
+    endpoint_names = {}
+    for endpoints in [sewer_fittings, sewer_cleanouts, sewer_manholes]:
+        with arcpy.da.SearchCursor(endpoints, ["SHAPE@XY", "FACILITYID"], "FACILITYID IS NOT NULL") as cursor:
+            endpoint_names.update({Common.location_key(*feature[0]): feature[1] for feature in cursor if feature[0][0] is not None})
+
+    def endpoint_name(point):
+        return Common.location_lookup(endpoint_names, point.X, point.Y)
+
+    # Name city-owned mains' endpoints from their current shape and build map page Facility IDs from them in a single pass
+    Logging.logger.info("---------START FROMMH, TOMH, FACILITYID (Map Page)")
+    counts = {"FROMMH": 0, "TOMH": 0, "FACILITYID (Map Page)": 0}
+    main_fields = ["SHAPE@", "OWNEDBY", "FROMMH", "TOMH", "FACILITYID"]
+    main_selection = "STAGE = 0 AND (WATERTYPE = 'SS' OR WATERTYPE = 'CB') AND (FROMMH IS NULL OR TOMH IS NULL OR FACILITYID IS NULL)"
+    with arcpy.da.UpdateCursor(sewer_mains, main_fields, main_selection) as cursor:
+        for row in cursor:
+            shape, owned_by, from_mh, to_mh, facility_id = row
+            if owned_by == 1 and from_mh is None and shape is not None:
+                from_mh = endpoint_name(shape.firstPoint)
+                counts["FROMMH"] += from_mh is not None
+            if owned_by == 1 and to_mh is None and shape is not None:
+                to_mh = endpoint_name(shape.lastPoint)
+                counts["TOMH"] += to_mh is not None
+            if facility_id is None and from_mh is not None and to_mh is not None:
+                facility_id = f"{from_mh}-{to_mh}"
+                counts["FACILITYID (Map Page)"] += 1
+            if [from_mh, to_mh, facility_id] != row[2:]:
+                cursor.updateRow([shape, owned_by, from_mh, to_mh, facility_id])
+    for field_name, named_count in counts.items():
+        if named_count > 0:
+            Logging.logger.info("---------FINISH %s - COUNT=%s", field_name, named_count)
         else:
-            Logging.logger.info(f"---------PASS {field_to_calculate} - COUNT={selected_null_count}")
-
-    # Endpoint naming
-    # Manholes
-    endpoint_naming(sewer_manholes, "upstream", "Manholes")
-    endpoint_naming(sewer_manholes, "downstream", "Manholes")
-
-    # Cleanouts
-    endpoint_naming(sewer_cleanouts, "upstream", "Cleanouts")
-    endpoint_naming(sewer_cleanouts, "downstream", "Cleanouts")
-
-    # Fittings
-    endpoint_naming(sewer_fittings, "upstream", "Fittings")
-    endpoint_naming(sewer_fittings, "downstream", "Fittings")
-
-    # Facility ID (map page)
-    selected_null_facilityid = arcpy.SelectLayerByAttribute_management(sewer_mains, "NEW_SELECTION", "FACILITYID IS NULL AND STAGE = 0 AND (WATERTYPE = 'SS' OR WATERTYPE = 'CB')")
-    selected_null_facilityid_count = arcpy.GetCount_management(selected_null_facilityid).getOutput(0)
-    if int(selected_null_facilityid_count) > 0:
-        Logging.logger.info(f"---------START FACILITYID (Map Page) - COUNT={selected_null_facilityid_count}")
-        arcpy.CalculateField_management(selected_null_facilityid, "FACILITYID", "!FROMMH! + '-' + !TOMH!", "PYTHON3")
-        Logging.logger.info(f"---------FINISH FACILITYID (Map Page) - COUNT={selected_null_facilityid_count}")
-    else:
-        Logging.logger.info(f"---------PASS FACILITYID (Map Page) - COUNT={selected_null_facilityid_count}")
+            Logging.logger.info("---------PASS %s - COUNT=0", field_name)
 
     # Facility ID (stormwater)
-    selected_null_facilityid_storm = arcpy.SelectLayerByAttribute_management(sewer_mains, "NEW_SELECTION", "FACILITYID IS NULL AND STAGE = 0 AND WATERTYPE = 'SW'")
-    selected_null_facilityid_storm_count = arcpy.GetCount_management(selected_null_facilityid_storm).getOutput(0)
-    if int(selected_null_facilityid_storm_count) > 0:
-        Logging.logger.info(f"---------START FACILITYID (Spatial) - COUNT={selected_null_facilityid_storm_count}")
-        arcpy.CalculateField_management(selected_null_facilityid_storm, "FACILITYID", "!SPATIALID!", "PYTHON3")
-        Logging.logger.info(f"---------FINISH FACILITYID (Spatial) - COUNT={selected_null_facilityid_storm_count}")
+    facility_id_storm_count = calculate_expression(sewer_mains, "FACILITYID", facility_id_spatial, "FACILITYID IS NULL AND STAGE = 0 AND WATERTYPE = 'SW'")
+    if facility_id_storm_count > 0:
+        Logging.logger.info("---------FINISH FACILITYID (Spatial) - COUNT=%s", facility_id_storm_count)
     else:
-        Logging.logger.info(f"---------PASS FACILITYID (Spatial) - COUNT={selected_null_facilityid_storm_count}")
+        Logging.logger.info("---------PASS FACILITYID (Spatial) - COUNT=%s", facility_id_storm_count)
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 if __name__ == "__main__":
-    traceback_info = traceback.format_exc()
     try:
         Logging.logger.info("Script Execution Started")
-        manholes()
-        inlets()
-        cleanouts()
-        fittings()
-        gravity_mains()
+
+        # Skip assets with no feature in the selections their fields are calculated for
+        point_selections = ["NAD83X IS NULL", "NAD83Y IS NULL", "SPATIALID IS NULL AND FACILITYID IS NULL"]
+        point_assets = [("manholes", sewer_manholes, point_selections + ["FACILITYID IS NULL AND OWNEDBY = -2", "FACILITYID IS NULL AND STAGE = 0 AND OWNEDBY = 1"], "NAVD88RIM"),
+                        ("inlets", sewer_inlets, point_selections + ["FACILITYID IS NULL"], "NAVD88INLET"),
+                        ("cleanouts", sewer_cleanouts, point_selections + ["FACILITYID IS NULL AND OWNEDBY = -2", "FACILITYID IS NULL AND OWNEDBY = 1"], "NAVD88LID"),
+                        ("fittings", sewer_fittings, ["FACILITYID IS NULL AND OWNEDBY = 1"], None)]
+        main_selections = ["NAD83XSTART IS NULL", "NAD83YSTART IS NULL", "NAD83XEND IS NULL", "NAD83YEND IS NULL",
+                           "FROMMH IS NULL AND OWNEDBY = -2", "TOMH IS NULL AND OWNEDBY = -2",
+                           "FACILITYID IS NULL AND (SPATAILSTART IS NULL OR SPATAILEND IS NULL OR SPATIALID IS NULL)",
+                           "STAGE = 0 AND (WATERTYPE = 'SS' OR WATERTYPE = 'CB') AND OWNEDBY = 1 AND (FROMMH IS NULL OR TOMH IS NULL OR FACILITYID IS NULL)",
+                           "STAGE = 0 AND (WATERTYPE = 'SS' OR WATERTYPE = 'CB') AND FACILITYID IS NULL AND FROMMH IS NOT NULL AND TOMH IS NOT NULL",
+                           "FACILITYID IS NULL AND STAGE = 0 AND WATERTYPE = 'SW'"]
+
+        # Point assets are separate feature classes so they're attributed in parallel; mains need their names so they go last
+        with Common.worker_pool(worker_count) as executor:
+            futures = []
+            for asset_name, feature, selections, z_field in point_assets:
+                if Common.needs_attribution(feature, selections, z_field):
+                    futures.append(executor.submit(Common.attribute_by_name, "Sewer", asset_name))
+                else:
+                    Logging.logger.info("---PASS %s - COUNT=0", os.path.basename(feature))
+            for future in futures:
+                future.result()
+        if Common.needs_attribution(sewer_mains, main_selections):
+            Common.attribute_safely(gravity_mains)
+        else:
+            Logging.logger.info("---PASS %s - COUNT=0", os.path.basename(sewer_mains))
         Logging.logger.info("Script Execution Finished")
-    except (IOError, NameError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
-        Logging.logger.info(traceback_info)
-    except NameError:
-        print(traceback_info)
+    except (IOError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
+        Logging.logger.info(traceback.format_exc())
     except arcpy.ExecuteError:
         Logging.logger.error(arcpy.GetMessages(2))
     except:
-        Logging.logger.info("An unspecified exception occurred")
+        Logging.logger.info("An unspecified exception occurred\n%s", traceback.format_exc())
@@ -34,6 +34,7 @@ import traceback
 import sys
 sys.path.insert(0, "Y:/Scripts")
 import Logging
+import Common
 
 # Paths - Geodatabase
 geodatabase_services_folder = "Z:\\"
@@ -50,253 +51,226 @@ storm_discharges = os.path.join(storm_dataset, "swDischargePoint")
 storm_culverts = os.path.join(storm_dataset, "swCulvert")
 storm_fittings = os.path.join(storm_dataset, "swFitting")
 
-# Paths - Engineering
-sewer_engineering = os.path.join(sde, "SewerEngineering")
-gps_nodes = os.path.join(sewer_engineering, "gpsNode")
+# Parallel workers for the point assets; each one checks out its own arcpy license and SDE connection, so keep this within what the server allows
+worker_count = min(5, os.cpu_count() or 1)
 
-# Field calculator expressions
-spatial_start = "str(int(!NAD83XSTART!))[2:4] + str(int(!NAD83YSTART!))[2:4] + '-' + str(int(!NAD83XSTART!))[4] + " \
-                "str(int(!NAD83YSTART!))[4] + '-' + str(int(!NAD83XSTART!))[-2:] + str(int(!NAD83YSTART!))[-2:]"
-spatial_end = "str(int(!NAD83XEND!))[2:4] + str(int(!NAD83YEND!))[2:4] + '-' + str(int(!NAD83XEND!))[4] + str(int(!NAD83YEND!))[4] + '-' + str(int(!NAD83XEND!))[-2:] + str(int(!NAD83YEND!))[-2:]"
-spatial_id_line_storm = "!SPATIALSTART! + '_' + !SPATIALEND!"
-spatial_id_point = "str(int(!NAD83X!))[2:4] + str(int(!NAD83Y!))[2:4] + '-' + str(int(!NAD83X!))[4] + str(int(!NAD83Y!))[4] + '-' + str(int(!NAD83X!))[-2:] + str(int(!NAD83Y!))[-2:]"
 
-
-# Template functions
-def template_geometry_calculator(input_feature, layer_name, field_name, geometry_name):
-    arcpy.MakeFeatureLayer_management(input_feature, layer_name, f"{field_name} IS NULL")
-    selected_nulls_count = arcpy.GetCount_management(layer_name).getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"---------START {field_name} - COUNT={selected_nulls_count}")
-        geometry_string = [[field_name, geometry_name]]
-        arcpy.CalculateGeometryAttributes_management(layer_name, geometry_string)
-        Logging.logger.info(f"---------FINISH {field_name} - COUNT={selected_nulls_count}")
-    else:
-        Logging.logger.info(f"---------PASS {field_name} - COUNT={selected_nulls_count}")
+# Field calculator functions and the source fields passed to them
+spatial_start = (["NAD83XSTART", "NAD83YSTART"], Common.spatial_id, Common.spatial_id_sql)
+spatial_end = (["NAD83XEND", "NAD83YEND"], Common.spatial_id, Common.spatial_id_sql)
+spatial_id_line_storm = (["SPATIALSTART", "SPATIALEND"], Common.spatial_id_line, Common.spatial_id_line_sql)
+spatial_id_point = (["NAD83X", "NAD83Y"], Common.spatial_id, Common.spatial_id_sql)
+spatial_id_field = (["SPATIALID"], Common.copy_value, Common.copy_value)
 
 
-def template_geometry_z_calculator(input_feature, layer_name, field_name):
-    arcpy.MakeFeatureLayer_management(input_feature, layer_name, f"{field_name} IS NULL")
-    arcpy.MakeFeatureLayer_management(gps_nodes, "gps_nodes")
-    gps_identical = arcpy.SelectLayerByLocation_management("gps_nodes", "ARE_IDENTICAL_TO", layer_name)
-    selected_nulls_count = arcpy.GetCount_management(gps_identical).getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"---------START {field_name} - COUNT={selected_nulls_count}")
-        with arcpy.da.SearchCursor(gps_identical, ["OBJECTID", "NAVD88Z"]) as cursor:
+# Template functions
+def template_spatial_calculator(input_feature, spatial_fields):
+    # Calculate each [field, expression] pair in order; with SQL when possible, otherwise every field in a single update cursor pass
+    counts = {field_name: Common.sql_spatial_update(input_feature, field_name, expression, f"{field_name} IS NULL") for field_name, expression in spatial_fields}
+    if None in counts.values():
+        counts = {field_name: 0 for field_name in counts}
+        fields = list(dict.fromkeys([source for field_name, expression in spatial_fields for source in expression[0]] + list(counts)))
+        with arcpy.da.UpdateCursor(input_feature, fields, " OR ".join(f"{field_name} IS NULL" for field_name in counts)) as cursor:
             for row in cursor:
-                selected_node = arcpy.SelectLayerByAttribute_management(gps_identical, "NEW_SELECTION", f"OBJECTID = {row[0]}")
-                selected_manhole = arcpy.SelectLayerByLocation_management(layer_name, "ARE_IDENTICAL_TO", selected_node)
-                arcpy.CalculateField_management(selected_manhole, field_name, f"{row[1]}", "PYTHON3")
-        Logging.logger.info(f"---------FINISH {field_name} - COUNT={selected_nulls_count}")
-    else:
-        Logging.logger.info(f"---------PASS {field_name} - COUNT={selected_nulls_count}")
-
-
-def template_spatial_calculator(input_feature, layer_name, field_name, expression):
-    arcpy.MakeFeatureLayer_management(input_feature, layer_name, f"{field_name} IS NULL")
-    selected_nulls_count = arcpy.GetCount_management(layer_name).getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"---------START {field_name} - COUNT={selected_nulls_count}")
-        arcpy.CalculateField_management(layer_name, field_name, expression)
-        Logging.logger.info(f"---------FINISH {field_name} - COUNT={selected_nulls_count}")
-    else:
-        Logging.logger.info(f"---------PASS {field_name} - COUNT={selected_nulls_count}")
+                values = dict(zip(fields, row))
+                for field_name, (source_fields, function, sql_function) in spatial_fields:
+                    sources = [values[source] for source in source_fields]
+                    if values[field_name] is None and None not in sources:
+                        values[field_name] = function(*sources)
+                        counts[field_name] += 1
+                cursor.updateRow([values[field] for field in fields])
+    for field_name, calculated_count in counts.items():
+        if calculated_count > 0:
+            Logging.logger.info("---------FINISH %s - COUNT=%s", field_name, calculated_count)
+        else:
+            Logging.logger.info("---------PASS %s - COUNT=%s", field_name, calculated_count)
 
 
 # Main functions
 @Logging.insert("Manholes", 1)
+@Common.edit_session(storm_manholes)
 def manholes():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["manholes_null_x", "NAD83X", "POINT_X"],
-        ["manholes_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(storm_manholes, field[0], field[1], field[2])
+    Common.template_geometry_calculator(storm_manholes, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(storm_manholes, "manholes_null_z", "NAVD88RIM")
+    Common.template_geometry_z_calculator(storm_manholes, "NAVD88RIM")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["manholes_spatial_id", "SPATIALID", spatial_id_point],
-        ["manholes_facility_id", "FACILITYID", "!SPATIALID!"]
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", spatial_id_field]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
-    for field in spatial_fields_to_calculate:
-        template_spatial_calculator(storm_manholes, field[0], field[1], field[2])
+    template_spatial_calculator(storm_manholes, spatial_fields_to_calculate)
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Inlets", 1)
+@Common.edit_session(storm_inlets)
 def inlets():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["inlets_null_x", "NAD83X", "POINT_X"],
-        ["inlets_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(storm_inlets, field[0], field[1], field[2])
+    Common.template_geometry_calculator(storm_inlets, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(storm_inlets, "inlets_null_z", "NAVD88INLET")
+    Common.template_geometry_z_calculator(storm_inlets, "NAVD88INLET")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["inlets_spatial_id", "SPATIALID", spatial_id_point],
-        ["inlets_facility_id", "FACILITYID", "!SPATIALID!"]
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", spatial_id_field]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
-    for field in spatial_fields_to_calculate:
-        template_spatial_calculator(storm_inlets, field[0], field[1], field[2])
+    template_spatial_calculator(storm_inlets, spatial_fields_to_calculate)
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Cleanouts", 1)
+@Common.edit_session(storm_cleanouts)
 def cleanouts():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["cleanouts_null_x", "NAD83X", "POINT_X"],
-        ["cleanouts_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(storm_inlets, field[0], field[1], field[2])
+    Common.template_geometry_calculator(storm_cleanouts, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(storm_cleanouts, "cleanouts_null_z", "NAVD88LID")
+    Common.template_geometry_z_calculator(storm_cleanouts, "NAVD88LID")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["cleanouts_spatial_id", "SPATIALID", spatial_id_point],
-        ["cleanouts_facility_id", "FACILITYID", "!SPATIALID!"]
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", spatial_id_field]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
-    for field in spatial_fields_to_calculate:
-        template_spatial_calculator(storm_inlets, field[0], field[1], field[2])
+    template_spatial_calculator(storm_cleanouts, spatial_fields_to_calculate)
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Discharge Points", 1)
+@Common.edit_session(storm_discharges)
 def discharges():
     """Calculate fields for sewer manholes"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["discharge_null_x", "NAD83X", "POINT_X"],
-        ["discharge_null_y", "NAD83Y", "POINT_Y"]
+        ["NAD83X", "POINT_X"],
+        ["NAD83Y", "POINT_Y"]
         ]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(storm_discharges, field[0], field[1], field[2])
+    Common.template_geometry_calculator(storm_discharges, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     Logging.logger.info("------START Geometry (Z) Calculation")
-    template_geometry_z_calculator(storm_discharges, "discharge_null_z", "NAVD88FL")
+    Common.template_geometry_z_calculator(storm_discharges, "NAVD88FL")
     Logging.logger.info("------FINISH Geometry (Z) Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["discharge_spatial_id", "SPATIALID", spatial_id_point],
-        ["discharge_facility_id", "FACILITYID", "!SPATIALID!"]
+        ["SPATIALID", spatial_id_point],
+        ["FACILITYID", spatial_id_field]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
-    for field in spatial_fields_to_calculate:
-        template_spatial_calculator(storm_discharges, field[0], field[1], field[2])
+    template_spatial_calculator(storm_discharges, spatial_fields_to_calculate)
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Culverts", 1)
+@Common.edit_session(storm_culverts)
 def culverts():
     """Calculate fields for sewer gravity mains"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["culverts_null_x_start", "NAD83XSTART", "LINE_START_X"],
-        ["culverts_null_y_start", "NAD83YSTART", "LINE_START_Y"],
-        ["culverts_null_x_end", "NAD83XEND", "LINE_END_X"],
-        ["culverts_null_y_end", "NAD83YEND", "LINE_END_Y"]]
+        ["NAD83XSTART", "LINE_START_X"],
+        ["NAD83YSTART", "LINE_START_Y"],
+        ["NAD83XEND", "LINE_END_X"],
+        ["NAD83YEND", "LINE_END_Y"]]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(storm_mains, field[0], field[1], field[2])
+    Common.template_geometry_calculator(storm_culverts, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["culverts_null_spatial_start", "SPATIALSTART", spatial_start],
-        ["culverts_null_spatial_end", "SPATIALEND", spatial_end],
-        ["culverts_null_spatial_id", "SPATIALID", spatial_id_line_storm],
-        ["culverts_null_facility_id", "FACILITYID", spatial_id_line_storm]
+        ["SPATIALSTART", spatial_start],
+        ["SPATIALEND", spatial_end],
+        ["SPATIALID", spatial_id_line_storm],
+        ["FACILITYID", spatial_id_line_storm]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
-    for field in spatial_fields_to_calculate:
-        template_spatial_calculator(storm_mains, field[0], field[1], field[2])
+    template_spatial_calculator(storm_culverts, spatial_fields_to_calculate)
     Logging.logger.info("------FINISH Spatial Calculation")
 
 
 @Logging.insert("Fittings", 1)
+@Common.edit_session(storm_fittings)
 def fittings():
-    arcpy.MakeFeatureLayer_management(storm_fittings, "fittings_null_facility_id", "FACILITYID IS NULL")
-    selected_nulls_count = arcpy.GetCount_management("fittings_null_facility_id").getOutput(0)
-    if int(selected_nulls_count) > 0:
-        Logging.logger.info(f"------START FACILITYID - COUNT={selected_nulls_count}")
-        with arcpy.da.SearchCursor("fittings_null_facility_id", ["OBJECTID", "FACILITYID", "SHAPE@X", "SHAPE@Y"]) as cursor:
+    selected_nulls_count = Common.count_rows(storm_fittings, "FACILITYID IS NULL")
+    if selected_nulls_count > 0:
+        Logging.logger.info("------START FACILITYID - COUNT=%s", selected_nulls_count)
+        with arcpy.da.UpdateCursor(storm_fittings, ["SHAPE@X", "SHAPE@Y", "FACILITYID"], "FACILITYID IS NULL") as cursor:
             for row in cursor:
-                x_coordinate = row[2]
-                y_coordinate = row[3]
-                facility_id = str(int(x_coordinate))[2:4] + str(int(y_coordinate))[2:4] + '-' + str(int(x_coordinate))[4] + str(int(y_coordinate))[4] + '-' + str(int(x_coordinate))[-2:] + str(int(y_coordinate))[-2:]
-                selected_fittings = arcpy.SelectLayerByAttribute_management("fittings_null_facility_id", "NEW_SELECTION", f"OBJECTID = {row[0]}")
-                arcpy.CalculateField_management(selected_fittings, f"FACILITYID", f"'{facility_id}'", "PYTHON3")
-        Logging.logger.info(f"------FINISH FACILITYID - COUNT={selected_nulls_count}")
+                if row[0] is not None:
+                    cursor.updateRow([row[0], row[1], Common.spatial_id(row[0], row[1])])
+        Logging.logger.info("------FINISH FACILITYID - COUNT=%s", selected_nulls_count)
     else:
-        Logging.logger.info(f"------PASS FACILITYID - COUNT={selected_nulls_count}")
+        Logging.logger.info("------PASS FACILITYID - COUNT=%s", selected_nulls_count)
 
 
 @Logging.insert("Gravity Mains", 1)
+@Common.edit_session(storm_mains)
 def gravity_mains():
     """Calculate fields for sewer gravity mains"""
     # Geometry fields
     geometry_fields_to_calculate = [
-        ["mains_null_x_start", "NAD83XSTART", "LINE_START_X"],
-        ["mains_null_y_start", "NAD83YSTART", "LINE_START_Y"],
-        ["mains_null_x_end", "NAD83XEND", "LINE_END_X"],
-        ["mains_null_y_end", "NAD83YEND", "LINE_END_Y"]]
+        ["NAD83XSTART", "LINE_START_X"],
+        ["NAD83YSTART", "LINE_START_Y"],
+        ["NAD83XEND", "LINE_END_X"],
+        ["NAD83YEND", "LINE_END_Y"]]
 
     Logging.logger.info("------START Geometry Calculation")
-    for field in geometry_fields_to_calculate:
-        template_geometry_calculator(storm_mains, field[0], field[1], field[2])
+    Common.template_geometry_calculator(storm_mains, geometry_fields_to_calculate)
     Logging.logger.info("------FINISH Geometry Calculation")
 
     # Spatial fields
     spatial_fields_to_calculate = [
-        ["mains_null_spatial_start", "SPATIALSTART", spatial_start],
-        ["mains_null_spatial_end", "SPATIALEND", spatial_end],
-        ["mains_null_spatial_id", "SPATIALID", spatial_id_line_storm],
-        ["mains_null_facility_id", "FACILITYID", spatial_id_line_storm]
+        ["SPATIALSTART", spatial_start],
+        ["SPATIALEND", spatial_end],
+        ["SPATIALID", spatial_id_line_storm],
+        ["FACILITYID", spatial_id_line_storm]
     ]
 
     Logging.logger.info("------START Spatial Calculation")
-    for field in spatial_fields_to_calculate:
-        template_spatial_calculator(storm_mains, field[0], field[1], field[2])
+    template_spatial_calculator(storm_mains, spatial_fields_to_calculate)
     Logging.logger.info("------FINISH Spatial Calculation")
 
     # Commented out because Storm FROMMH and TOMH fields need to be lengthened from 11 to 12 characters
@@ -351,22 +325,37 @@ def gravity_mains():
 
 
 if __name__ == "__main__":
-    traceback_info = traceback.format_exc()
     try:
         Logging.logger.info("Script Execution Started")
-        manholes()
-        inlets()
-        cleanouts()
-        discharges()
-        culverts()
-        fittings()
-        gravity_mains()
+
+        # Skip assets with no feature in the selections their fields are calculated for
+        point_selections = ["NAD83X IS NULL", "NAD83Y IS NULL", "SPATIALID IS NULL", "FACILITYID IS NULL"]
+        line_selections = [f"{field} IS NULL" for field in ["NAD83XSTART", "NAD83YSTART", "NAD83XEND", "NAD83YEND", "SPATIALSTART", "SPATIALEND", "SPATIALID", "FACILITYID"]]
+        point_assets = [("manholes", storm_manholes, point_selections, "NAVD88RIM"),
+                        ("inlets", storm_inlets, point_selections, "NAVD88INLET"),
+                        ("cleanouts", storm_cleanouts, point_selections, "NAVD88LID"),
+                        ("discharges", storm_discharges, point_selections, "NAVD88FL"),
+                        ("fittings", storm_fittings, ["FACILITYID IS NULL"], None),
+                        ("culverts", storm_culverts, line_selections, None)]
+
+        # Point assets and culverts are separate feature classes so they're attributed in parallel; mains are named from the manholes so they go last
+        with Common.worker_pool(worker_count) as executor:
+            futures = []
+            for asset_name, feature, selections, z_field in point_assets:
+                if Common.needs_attribution(feature, selections, z_field):
+                    futures.append(executor.submit(Common.attribute_by_name, "Storm", asset_name))
+                else:
+                    Logging.logger.info("---PASS %s - COUNT=0", os.path.basename(feature))
+            for future in futures:
+                future.result()
+        if Common.needs_attribution(storm_mains, line_selections):
+            Common.attribute_safely(gravity_mains)
+        else:
+            Logging.logger.info("---PASS %s - COUNT=0", os.path.basename(storm_mains))
         Logging.logger.info("Script Execution Finished")
-    except (IOError, NameError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
-        Logging.logger.info(traceback_info)
-    except NameError:
-        print(traceback_info)
+    except (IOError, KeyError, IndexError, TypeError, UnboundLocalError, ValueError):
+        Logging.logger.info(traceback.format_exc())
     except arcpy.ExecuteError:
         Logging.logger.error(arcpy.GetMessages(2))
     except:
-        Logging.logger.info("An unspecified exception occurred")
+        Logging.logger.info("An unspecified exception occurred\n%s", traceback.format_exc())